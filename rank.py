@@ -1,13 +1,40 @@
 import random
 import argparse
-import shutil
+import os
 import sys
-import json
-import io
+from math import exp, log
+
+import numpy as np
+import orjson
+
+try:
+    import numba
+except ImportError:
+    numba = None
 
 
 ENCODING = "utf-8"
 
+K_FACTOR = 40
+
+# Rating differences beyond this are clamped; the rounded rating change
+# saturates (at 0 or K_FACTOR) well before +/-800 for any reasonable K
+MAX_RATING_DIFF = 800
+
+# Precomputed winner rating gains, indexed by (loser.rating - winner.rating)
+# offset by MAX_RATING_DIFF. Elo is zero-sum for equal K-factors, so the
+# loser's rating change is just the negation of the winner's gain
+ELO_DELTA = [
+    round(K_FACTOR * (1 - 1 / (1 + 10 ** (diff / 400))))
+    for diff in range(-MAX_RATING_DIFF, MAX_RATING_DIFF + 1)
+]
+
+# How many nearest-rated items to consider as the opponent in a matchup
+DEFAULT_MATCHUP_WINDOW = 10
+
+# 10 ** (diff / 400) == exp(LN10_OVER_400 * diff); exp is the faster call
+LN10_OVER_400 = log(10) / 400
+
 
 class EloItem:
     """Represents an item with an Elo rating for comparison purposes
@@ -27,21 +54,16 @@ class EloItem:
 
     """
 
+    # Fixed-offset slots instead of a per-instance __dict__: smaller
+    # instances and faster attribute access in the rating-update paths
+    __slots__ = ("name", "rating")
+
     def __init__(self, name: str, rating: int = 1500):
         self.name: str = name
-        self._rating: int = rating
-
-    @property
-    def rating(self):
-        """Current ELO rating of the EloItem"""
-        return self._rating
-
-    @rating.setter
-    def rating(self, new_rating: int):
-        self._rating = new_rating
+        self.rating: int = rating
 
     def __repr__(self):
-        return f"{self.name}: {self._rating}"
+        return f"{self.name}: {self.rating}"
 
     def __str__(self):
         return self.name
@@ -79,7 +101,7 @@ class EloItem:
         Returns:
             float: a value between 0 and 1, representing win probability
         """
-        return 1 / (1 + 10 ** ((other_item.rating - self.rating) / 400))
+        return 1.0 / (1.0 + exp(LN10_OVER_400 * (other_item.rating - self.rating)))
 
     def update_rating(self, opponent: "EloItem", did_win: bool, k: int = 40):
         """Updates this item's rating based on opponent and match outcome
@@ -99,106 +121,319 @@ class EloItem:
         self.rating += rating_change
 
 
-def update_elo_ratings(winner: EloItem, loser: EloItem):
+class ItemSet:
+    """Structure-of-arrays container for the items being ranked
+
+    Instead of one object per item, all ratings live in a single
+    contiguous numpy array indexed in parallel with the names list.
+    Rating reads/writes become plain array indexing and sorting for
+    results is an argsort over the int buffer
+
+    Attributes:
+        names: Name or identifier for each item
+        ratings: int32 array of current Elo ratings, parallel to names
+        matchup_counts: int32 array counting how often each item has been matched
+
+    Methods:
+        from_names(names): [Class Method] Creates an ItemSet with default ratings
+        from_dicts(dict_items): [Class Method] Creates an ItemSet from saved dictionaries
+        to_json(): Returns a list of dictionaries suitable for JSON serialization
+
+    """
+
+    def __init__(self, names: list[str], ratings: np.ndarray):
+        self.names: list[str] = names
+        self.ratings: np.ndarray = ratings
+        self.matchup_counts: np.ndarray = np.zeros(len(names), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_names(cls, names: list[str]):
+        """Creates an ItemSet where every item starts at the default rating
+
+        Args:
+            names: Names of the items to rank
+
+        Returns:
+            ItemSet: A new ItemSet with all ratings at 1500
+        """
+        return cls(names, np.full(len(names), 1500, dtype=np.int32))
+
+    @classmethod
+    def from_dicts(cls, dict_items: list[dict]):
+        """Creates an ItemSet from a list of saved dictionaries
+
+        Args:
+            dict_items: Dictionaries with 'name' and 'rating' keys
+
+        Returns:
+            ItemSet: A new ItemSet populated from the dictionaries
+        """
+        names = [d["name"] for d in dict_items]
+        ratings = np.array([d["rating"] for d in dict_items], dtype=np.int32)
+        return cls(names, ratings)
+
+    def to_json(self):
+        """Convert the item set to a json-dumpable format
+
+        Returns:
+            list: One {'name', 'rating'} dict per item
+        """
+        return [
+            {"name": name, "rating": int(rating)}
+            for name, rating in zip(self.names, self.ratings)
+        ]
+
+
+def update_elo_ratings(ratings: np.ndarray, winner: int, loser: int):
     """Updates the Elo ratings for the items after a matchup
 
+    Uses the precomputed ELO_DELTA table rather than computing expected
+    scores per matchup, so each update is a single list index plus two
+    integer adds
+
     Args:
-        winner: EloItem representing the winner
-        loser: EloItem representing the loser
+        ratings: Array of current ratings, modified in place
+        winner: Index of the winning item
+        loser: Index of the losing item
     """
-    winner.update_rating(loser, True)
-    loser.update_rating(winner, False)
+    diff = int(ratings[loser]) - int(ratings[winner])
+    diff = max(-MAX_RATING_DIFF, min(MAX_RATING_DIFF, diff))
+    gain = ELO_DELTA[diff + MAX_RATING_DIFF]
+    ratings[winner] += gain
+    ratings[loser] -= gain
 
 
-def get_matchup(items: list[EloItem]):
-    """Return two different items from a collection of items
+def batch_update(
+    ratings: np.ndarray, winners: np.ndarray, losers: np.ndarray, k: int = K_FACTOR
+):
+    """Apply a whole batch of recorded matchups to the ratings at once
 
-    In the future: Improve selection algorithm, so instead of being a random choice,
-        bias the choice based on some heuristic:
-        - Track how many times each item has been chosen, ensure each item receives a similar number of matchups
-        - Match similarly rated items against each other
-        - Break tied ratings by forcing matchups between them
+    Vectorized alternative to calling update_elo_ratings per matchup,
+    for replaying thousands of recorded outcomes without a Python-level
+    loop. Expected scores for the entire batch are computed from the
+    ratings as they stand when the batch is applied, so replay in
+    reasonably sized chunks if sequential behavior matters
 
     Args:
-        items: collection of comparable items
+        ratings: Array of current ratings, modified in place
+        winners: Array of winning item indices, one per matchup
+        losers: Array of losing item indices, parallel to winners
+        k (optional): The K-factor, determining the magnitude of rating updates
+    """
+    diff = (ratings[losers] - ratings[winners]) / 400.0
+    exp_score = 1.0 / (1.0 + np.power(10.0, diff))
+    gain = np.rint(k * (1.0 - exp_score)).astype(np.int32)
 
-    Returns:
-        List: Two different items from the input collection
+    # np.add.at accumulates correctly when an index appears multiple
+    # times in a batch, unlike ratings[winners] += gain
+    np.add.at(ratings, winners, gain)
+    np.add.at(ratings, losers, -gain)
+
+
+def _replay_kernel(ratings, winners, losers, k=K_FACTOR):
+    """Apply recorded matchups strictly one at a time, in order
+
+    Pure arithmetic over the int arrays with no Python object traffic,
+    so when numba is installed the whole loop compiles to native code
+    (see below) and million-matchup replays finish in well under a
+    second. Unlike batch_update, each matchup sees the ratings left by
+    the one before it, matching what the interactive loop would produce
+
+    Args:
+        ratings: Array of current ratings, modified in place
+        winners: Array of winning item indices, one per matchup
+        losers: Array of losing item indices, parallel to winners
+        k (optional): The K-factor, determining the magnitude of rating updates
     """
-    return random.sample(items, 2)
+    for i in range(winners.size):
+        diff = ratings[losers[i]] - ratings[winners[i]]
+        exp_score = 1.0 / (1.0 + 10.0 ** (diff / 400.0))
+        gain = np.int32(np.rint(k * (1.0 - exp_score)))
+        ratings[winners[i]] += gain
+        ratings[losers[i]] -= gain
 
 
-def present_matchup_and_update(items: list[EloItem]):
+if numba is not None:
+    _replay_kernel = numba.njit(cache=True)(_replay_kernel)
+
+
+def replay_match_log(ratings: np.ndarray, log_path: str, chunk_size: int = 4096):
+    """Replay an append-only matchup log against the ratings
+
+    Streams the NDJSON log (one {"w", "l"} index pair per line) through
+    the replay kernel in chunks, recovering matchups that were logged
+    after the last clean rankinfo save
+
+    Args:
+        ratings: Array of current ratings, modified in place
+        log_path: Path to the NDJSON matchup log
+        chunk_size (optional): How many matchups to apply per batch
+    """
+    winners: list[int] = []
+    losers: list[int] = []
+    with open(log_path, mode="rb") as fp_read:
+        for line in fp_read:
+            if not line.strip():
+                continue
+            event = orjson.loads(line)
+            winners.append(event["w"])
+            losers.append(event["l"])
+
+            if len(winners) == chunk_size:
+                _replay_kernel(ratings, np.array(winners), np.array(losers))
+                winners.clear()
+                losers.clear()
+
+    if winners:
+        _replay_kernel(ratings, np.array(winners), np.array(losers))
+
+
+def get_matchup(item_set: ItemSet, window: int = DEFAULT_MATCHUP_WINDOW):
+    """Return the indices of two different items from the item set
+
+    Rather than sampling uniformly (where most matchups pit wildly
+    mismatched items and teach us almost nothing), pick the first item
+    from those with the fewest matchups so far, then pick its opponent
+    from the `window` closest-rated items. Close matchups carry the
+    most ranking information per comparison. While no item has been
+    matched yet the first pick is uniform
+
+    In the future:
+        - Break tied ratings by forcing matchups between them
+
+    Args:
+        item_set: The items being ranked
+        window: How many nearest-rated items to draw the opponent from
+
+    Returns:
+        List: Indices of two different items in the item set
+    """
+    counts = item_set.matchup_counts
+    if counts.min() == counts.max():
+        # Flat counts: every item is equally under-matched
+        first = random.randrange(len(item_set))
+    else:
+        first = int(random.choice(np.flatnonzero(counts == counts.min())))
+
+    # Distance in rating space from the first pick; exclude self-matchup
+    gaps = np.abs(item_set.ratings - item_set.ratings[first])
+    gaps[first] = np.iinfo(np.int32).max
+    window = min(window, len(item_set) - 1)
+    candidates = np.argpartition(gaps, window - 1)[:window]
+    second = int(random.choice(candidates))
+
+    counts[first] += 1
+    counts[second] += 1
+    return [first, second]
+
+
+def present_matchup_and_update(
+    item_set: ItemSet,
+    window: int = DEFAULT_MATCHUP_WINDOW,
+    choice_lines=None,
+    match_log=None,
+):
     """Presents a matchup, gets user choice, and updates Elo ratings
 
     Args:
-        items: A list of EloItem objects.
+        item_set: The items being ranked
+        window: How many nearest-rated items to draw the opponent from
+        choice_lines (optional): Iterator of pre-scripted choice lines.
+            When given, prompts are skipped and choices are read from it
+            directly; exhausting the iterator ends the session
+        match_log (optional): Binary file to append the matchup outcome
+            to as one NDJSON event, flushed so it survives a crash
 
     Returns:
         bool: True if the user wants to continue, False to see results
     """
-    item_1, item_2 = get_matchup(items)
+    idx_1, idx_2 = get_matchup(item_set, window)
 
-    print(f"\nWhich do you prefer:\n" f" [1] {item_1}\n" f" [2] {item_2}\n")
-    choice = input("Choose 1 or 2 (other to see results): ")
+    if choice_lines is not None:
+        choice = next(choice_lines, "").strip()
+    else:
+        # One write for the whole prompt instead of a print per line
+        sys.stdout.write(
+            f"\nWhich do you prefer:\n"
+            f" [1] {item_set.names[idx_1]}\n"
+            f" [2] {item_set.names[idx_2]}\n"
+            f"\nChoose 1 or 2 (other to see results): "
+        )
+        sys.stdout.flush()
+        choice = input()
 
     if choice == "1":
-        winner = item_1
-        loser = item_2
+        winner = idx_1
+        loser = idx_2
     elif choice == "2":
-        winner = item_2
-        loser = item_1
+        winner = idx_2
+        loser = idx_1
     else:
         return False
 
-    update_elo_ratings(winner, loser)
+    update_elo_ratings(item_set.ratings, winner, loser)
+
+    if match_log is not None:
+        match_log.write(orjson.dumps({"w": winner, "l": loser}) + b"\n")
+        match_log.flush()
+
     return True
 
 
-def write_buffer_to_results(file_name: str, str_buffer: io.StringIO):
-    """Write the str_buffer to a results file
+def write_results_file(file_name: str, text: str):
+    """Write the formatted results text to a results file
 
     Returns:
         str: Filename of the file the results were saved to
     """
     full_file_name = f"results_{file_name}.txt"
     with open(full_file_name, mode="w", encoding=ENCODING) as fp_write:
-        # Better than write(str_buffer.getvalue()):
-        # https://stackoverflow.com/questions/3253258/what-is-the-best-way-to-write-the-contents-of-a-stringio-to-a-file
-        str_buffer.seek(0)
-        shutil.copyfileobj(str_buffer, fp_write)
+        fp_write.write(text)
     return full_file_name
 
 
-def display_results(sorted_items: list[EloItem], file_name: str):
+def display_results(item_set: ItemSet, file_name: str):
     """Format the results in a ranked list, print to stdout,
     then prompt user to optionally save the result output to a txt file
 
     Args:
-        sorted_items: A sorted list of items, with "best" item first, "worst" last
+        item_set: The items being ranked, in any order
         file_name: The base file name of the item set
     """
-    with io.StringIO() as str_buffer:
-        str_buffer.write("\n---- Ranked Results ----\n")
+    # Sort by rating, high to low; stable so equal ratings keep item order
+    order = np.argsort(-item_set.ratings, kind="stable")
+
+    lines = ["\n---- Ranked Results ----\n"]
 
-        prev_rating = None
-        for i, item in enumerate(sorted_items, 1):
-            if prev_rating == item.rating:
-                rank = prev_rank
-            else:
-                rank = i
+    prev_rating = None
+    for i, idx in enumerate(order, 1):
+        rating = int(item_set.ratings[idx])
+        if prev_rating == rating:
+            rank = prev_rank
+        else:
+            rank = i
 
-            str_buffer.write(f"{(rank):3}) {item} ({item.rating})\n")
+        lines.append(f"{(rank):3}) {item_set.names[idx]} ({rating})\n")
 
-            prev_rating = item.rating
-            prev_rank = rank
+        prev_rating = rating
+        prev_rank = rank
 
-        print(str_buffer.getvalue())
+    # Join once; the result is the only full copy of the output text
+    text = "".join(lines)
+    sys.stdout.write(text + "\n")
 
+    try:
         save_to_file = input("Save results to file? (y/n) ")
-        if save_to_file.lower() == "y":
-            output_file = write_buffer_to_results(file_name, str_buffer)
-            print(f"Results saved to {output_file}")
+    except EOFError:
+        # Scripted stdin (--quiet piping) may be exhausted by now;
+        # treat end-of-input as declining the save
+        save_to_file = "n"
+    if save_to_file.lower() == "y":
+        output_file = write_results_file(file_name, text)
+        print(f"Results saved to {output_file}")
 
 
 def get_args():
@@ -222,6 +457,26 @@ def get_args():
     parser_new.add_argument(
         "input_filename", help="Plaintext file with one item name per line."
     )
+    parser_new.add_argument(
+        "--replay",
+        metavar="MATCHLOG",
+        help=(
+            "JSON file of recorded matchups to apply in bulk instead of "
+            "running interactive comparisons."
+        ),
+    )
+    parser_new.add_argument(
+        "--matchup-window",
+        type=int,
+        default=DEFAULT_MATCHUP_WINDOW,
+        metavar="K",
+        help="Draw each opponent from the K nearest-rated items (default: %(default)s).",
+    )
+    parser_new.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Skip matchup prompts and read choices one per line from stdin.",
+    )
 
     parser_load = subparsers.add_parser(
         "load",
@@ -233,6 +488,26 @@ def get_args():
     parser_load.add_argument(
         "rankinfo_filename", help="JSON file containing saved ranking data."
     )
+    parser_load.add_argument(
+        "--replay",
+        metavar="MATCHLOG",
+        help=(
+            "JSON file of recorded matchups to apply in bulk instead of "
+            "running interactive comparisons."
+        ),
+    )
+    parser_load.add_argument(
+        "--matchup-window",
+        type=int,
+        default=DEFAULT_MATCHUP_WINDOW,
+        metavar="K",
+        help="Draw each opponent from the K nearest-rated items (default: %(default)s).",
+    )
+    parser_load.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Skip matchup prompts and read choices one per line from stdin.",
+    )
 
     return parser.parse_args()
 
@@ -249,28 +524,58 @@ def main():
 
     if args.command == "new":
         with open(args.input_filename, encoding=ENCODING) as fp_read:
-            items = [EloItem(line.strip()) for line in fp_read]
-            base_file_name = args.input_filename.split(".")[0]
+            # One read of the whole file beats per-line buffered iteration
+            names = [line.strip() for line in fp_read.read().splitlines()]
+            item_set = ItemSet.from_names([name for name in names if name])
+            base_file_name = os.path.splitext(os.path.basename(args.input_filename))[0]
     elif args.command == "load":
         # Load from existing item set
-        with open(args.rankinfo_filename, encoding=ENCODING) as fp_read:
-            item_dicts = json.load(fp_read)
-            items = [EloItem.from_dict(d) for d in item_dicts]
-            base_file_name = args.rankinfo_filename.split("_")[1].split(".")[0]
-
-    while present_matchup_and_update(items):
+        with open(args.rankinfo_filename, mode="rb") as fp_read:
+            item_dicts = orjson.loads(fp_read.read())
+            item_set = ItemSet.from_dicts(item_dicts)
+            # File names follow rankinfo_<base>.json; keep everything
+            # after the first underscore so <base> may contain its own
+            base_file_name = os.path.splitext(
+                os.path.basename(args.rankinfo_filename)
+            )[0].partition("_")[2]
+
+    match_log_name = f"matches_{base_file_name}.ndjson"
+    if args.command == "load" and os.path.exists(match_log_name):
+        # Crash recovery: apply any matchups logged after the last clean save
+        replay_match_log(item_set.ratings, match_log_name)
+
+    if args.replay:
+        # Apply recorded matchups in bulk: a JSON array of
+        # {"w": winner_index, "l": loser_index} objects
+        with open(args.replay, mode="rb") as fp_read:
+            matches = orjson.loads(fp_read.read())
+        winners = np.array([match["w"] for match in matches], dtype=np.intp)
+        losers = np.array([match["l"] for match in matches], dtype=np.intp)
+        _replay_kernel(item_set.ratings, winners, losers)
+    else:
+        choice_lines = iter(sys.stdin) if args.quiet else None
+        # 'new' discards any stale log since ratings start over; 'load'
+        # appends so interrupted sessions keep their recovered matchups
+        log_mode = "wb" if args.command == "new" else "ab"
+        with open(match_log_name, mode=log_mode) as match_log:
+            while present_matchup_and_update(
+                item_set, args.matchup_window, choice_lines, match_log
+            ):
+                pass
+
+    # Compact the log before saving: the save below folds in every
+    # logged matchup, and a leftover log would be double-applied by the
+    # next load. Crashing between the two steps loses this session's
+    # matchups, which is safer than counting them twice
+    with open(match_log_name, mode="wb"):
         pass
 
-    # Mode 'w' will overwrite the file contents if file already exists
-    with open(
-        f"rankinfo_{base_file_name}.json", mode="w+", encoding=ENCODING
-    ) as fp_write:
-        # Construct a json array of the items, converting each item to json-dumpable format
-        json.dump([item.to_json() for item in items], fp_write, indent=2)
+    # Mode 'wb' will overwrite the file contents if file already exists
+    with open(f"rankinfo_{base_file_name}.json", mode="wb") as fp_write:
+        # Construct a json array of the items in json-dumpable format
+        fp_write.write(orjson.dumps(item_set.to_json(), option=orjson.OPT_INDENT_2))
 
-    # Sort by rating, high to low
-    items.sort(key=lambda item: item.rating, reverse=True)
-    display_results(items, base_file_name)
+    display_results(item_set, base_file_name)
 
     return 0
 